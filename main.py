@@ -1,8 +1,7 @@
-import os, glob, re, hashlib
-from typing import Tuple, Dict
-from tts import text_to_speech
-from video import make_video
-import yaml
+import os, re, hashlib
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Tuple, Dict, Optional
 
 # --- add helpers ---
 LANG_BY_CC = {"HI": "hi", "BN": "bn", "EN": "en"}
@@ -20,21 +19,37 @@ SCRIPTS_ROOT = "input/scripts"
 AUDIO_DIR = "output/audio"
 FINAL_DIR = "output/final"
 
+# scripts in flight at once (mostly waiting on gTTS / Pexels)
+PIPELINE_WORKERS = max(1, int(os.getenv("PIPELINE_WORKERS", "4")))
+
 os.makedirs(AUDIO_DIR, exist_ok=True)
 os.makedirs(FINAL_DIR, exist_ok=True)
 
-FM_RE = re.compile(r"^\s*---\s*\n(.*?)\n---\s*\n(.*)$", re.DOTALL)
+# closing front-matter delimiter: a "---" line, trailing blanks allowed
+_FM_CLOSE = re.compile(r"\n---[ \t]*\n")
+
+def _split_fm(raw: str) -> Tuple[Optional[str], str]:
+    """Split `---` front-matter off the top of a script: (yaml_text or None, body)."""
+    text = raw.lstrip()
+    first, nl, rest = text.partition("\n")
+    if not nl or first.rstrip() != "---":
+        return None, raw
+    end = _FM_CLOSE.search(rest)
+    if not end:
+        return None, raw
+    return rest[:end.start()], rest[end.end():]
 
 def parse_script(path: str) -> Tuple[Dict, str]:
     """Return (meta, body_text). Meta from YAML front-matter if present."""
     with open(path, "r", encoding="utf-8") as f:
-        raw = f.read()
-    m = FM_RE.match(raw)
-    if m:
-        fm_yaml, body = m.group(1), m.group(2)
-        meta = yaml.safe_load(fm_yaml) or {}
+        raw = f.read().replace("\r\n", "\n")
+    fm_yaml, body = _split_fm(raw)
+    if fm_yaml is not None:
+        import yaml  # only needed when there is front-matter
+        # libyaml-backed loader when PyYAML was built with it (~10× faster than pure Python)
+        meta = yaml.load(fm_yaml, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)) or {}
     else:
-        meta, body = {}, raw
+        meta = {}
 
     fname = os.path.splitext(os.path.basename(path))[0]
     meta.setdefault("id", fname)
@@ -60,37 +75,46 @@ def safe_id(s: str) -> str:
     s2 = re.sub(r"[^A-Za-z0-9_\-]+", "-", s).strip("-")
     return s2 or hashlib.sha1(s.encode("utf-8")).hexdigest()[:8]
 
-def discover_scripts():
-    patterns = [
-        os.path.join(SCRIPTS_ROOT, "**", "*.md"),
-        os.path.join(SCRIPTS_ROOT, "**", "*.txt"),
-    ]
-    files = []
-    for p in patterns:
-        files.extend(glob.glob(p, recursive=True))
-    return sorted(files)
+def _iter_scripts(root: str):
+    # single scandir walk; DirEntry caches the type, so no extra stat per entry
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                yield from _iter_scripts(entry.path)
+            elif entry.name.endswith((".md", ".txt")):
+                yield entry.path
 
-def run_pipeline(limit: int = 0):
-    files = discover_scripts()
-    if not files:
-        print(f"❌ No scripts found under {SCRIPTS_ROOT}/")
-        return
+def discover_scripts():
+    if not os.path.isdir(SCRIPTS_ROOT):
+        return []
+    return sorted(_iter_scripts(SCRIPTS_ROOT))
+
+def _process_one(path: str, idx: int, total: int) -> Optional[str]:
+    """Parse, synthesize and render one script. Returns the MP4 path, or None if skipped/failed."""
+    meta, body = parse_script(path)
+    script_id = safe_id(meta.get("id", os.path.splitext(os.path.basename(path))[0]))
+    lang = meta.get("lang") or "en"  # for logging only
+
+    if not body:
+        print(f"⚠️  Skipping empty script: {path}")
+        return None
+    if already_done(script_id):
+        print(f"⏭️  Skipping {script_id} (final MP4 exists)")
+        return None
 
-    produced = 0
-    for idx, path in enumerate(files, start=1):
-        meta, body = parse_script(path)
-        script_id = safe_id(meta.get("id", os.path.splitext(os.path.basename(path))[0]))
-        lang = meta.get("lang") or "en"  # for logging only
+    # imported here, not at module top: gTTS, pydub and the HTTP stacks only load once a
+    # script actually needs rendering, so skip-only reruns start instantly
+    from tts import text_to_speech
+    from video import make_video, prefetch_clips
 
-        if not body:
-            print(f"⚠️  Skipping empty script: {path}")
-            continue
-        if already_done(script_id):
-            print(f"⏭️  Skipping {script_id} (final MP4 exists)")
-            continue
+    print(f"\n🎬 [{idx}/{total}] {script_id} | {meta.get('channel_code','?')} | lang={lang}")
+    audio_path = os.path.join(AUDIO_DIR, f"{script_id}.mp3")
 
-        print(f"\n🎬 [{idx}/{len(files)}] {script_id} | {meta.get('channel_code','?')} | lang={lang}")
-        audio_path = os.path.join(AUDIO_DIR, f"{script_id}.mp3")
+    # Pexels search + clip downloads run in the background while gTTS is synthesizing
+    with ThreadPoolExecutor(max_workers=1) as bg:
+        clips = bg.submit(prefetch_clips, body, meta)
 
         # TTS (tts.py will also normalize from channel_code if needed)
         text_to_speech(
@@ -101,16 +125,63 @@ def run_pipeline(limit: int = 0):
         )
 
         try:
-            final_video = make_video(audio_path, body, meta)
+            final_video = make_video(audio_path, body, meta, prefetched_urls=clips.result())
             print(f"✅ Done: {final_video}")
-            produced += 1
+            return final_video
         except Exception as e:
             print(f"❌ Failed {script_id}: {e}")
+            return None
+
+def run_pipeline(limit: int = 0):
+    files = discover_scripts()
+    if not files:
+        print(f"❌ No scripts found under {SCRIPTS_ROOT}/")
+        return
 
-        if limit and produced >= limit:
-            print(f"\n✅ Limit reached ({limit}). Stopping.")
-            break
+    # Skip finished scripts before opening them (front-matter `id` normally equals the
+    # filename; _process_one re-checks with the parsed id)
+    jobs = []
+    for idx, path in enumerate(files, start=1):
+        script_id = safe_id(os.path.splitext(os.path.basename(path))[0])
+        if already_done(script_id):
+            print(f"⏭️  Skipping {script_id} (final MP4 exists)")
+            continue
+        jobs.append((path, idx))
+
+    produced = 0
+    if not jobs:
+        print(f"\n🎉 Finished. Produced: {produced} videos.")
+        return
 
+    # there is work to do, so video.py loads now anyway; prune before any render holds a clip path
+    from video import prune_clip_cache
+    prune_clip_cache()
+
+    # Scripts run concurrently: TTS/Pexels of one overlap the encode of another. Threads are
+    # enough — the heavy lifting is network wait and ffmpeg subprocesses (encodes are
+    # throttled separately in video.py). Jobs are handed out lazily and never more than
+    # the limit still allows, so every started script can be kept: a skipped or failed
+    # one frees its slot for the next job.
+    workers = min(len(jobs), PIPELINE_WORKERS)
+    pending = iter(jobs)
+    in_flight = set()
+
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        while True:
+            room = workers - len(in_flight)
+            if limit:
+                room = min(room, limit - produced - len(in_flight))
+            for path, idx in islice(pending, max(0, room)):
+                in_flight.add(ex.submit(_process_one, path, idx, len(files)))
+            if not in_flight:
+                break
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut.result():
+                    produced += 1
+
+    if limit and produced >= limit:
+        print(f"\n✅ Limit reached ({limit}). Stopped.")
     print(f"\n🎉 Finished. Produced: {produced} videos.")
 
 if __name__ == "__main__":
@@ -1,12 +1,75 @@
 # tts.py — multilingual, long-script safe (HI / BN / EN)
+import io
 import os
 import re
+import base64
+import hashlib
 import time
 import tempfile
-from typing import List, Optional
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Iterable, List, Optional
 
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from gtts import gTTS
-from pydub import AudioSegment
+from gtts.tts import gTTSError
+
+if TYPE_CHECKING:
+    from pydub import AudioSegment  # imported lazily: only non-MP3 outputs decode audio
+
+# Concurrent gTTS requests for the whole process (scripts render on several threads and
+# share this pool); kept small so Google doesn't rate-limit us
+TTS_WORKERS = max(1, int(os.getenv("TTS_WORKERS", "4")))
+_TTS_POOL = ThreadPoolExecutor(max_workers=TTS_WORKERS)
+
+# Synthesized chunks are cached here, keyed by (lang, text); re-runs skip gTTS entirely
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join("cache", "tts"))
+
+# One keep-alive pool for every gTTS request in the process. Stock gTTS opens a new
+# Session (TCP + TLS handshake) for each ~100-char part it sends.
+# A failed part is retried on its own here; _speak_chunk's retry re-sends the whole chunk.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset({"GET", "POST"}),  # gTTS posts; synthesis is idempotent
+        raise_on_status=False,  # hand the last response back so gTTSError can report it
+    ),
+))
+
+_AUDIO_RE = re.compile(r'jQ1olc","\[\\"(.*)\\"]')
+
+
+class _PooledGTTS(gTTS):
+    """
+    gTTS that sends its requests over the shared session.
+    Mirrors gTTS.stream() from the pinned gTTS==2.5.4.
+    """
+
+    def stream(self):
+        for pr in self._prepare_requests():
+            try:
+                r = _SESSION.send(pr, proxies=urllib.request.getproxies(), timeout=self.timeout)
+                r.raise_for_status()
+            except requests.exceptions.HTTPError:
+                raise gTTSError(tts=self, response=r)
+            except requests.exceptions.RequestException:
+                raise gTTSError(tts=self)
+
+            for line in r.iter_lines(chunk_size=1024):
+                decoded = line.decode("utf-8")
+                if self.GOOGLE_TTS_RPC in decoded:
+                    m = _AUDIO_RE.search(decoded)
+                    if not m:
+                        # good response, but no audio stream in it
+                        raise gTTSError(tts=self, response=r)
+                    yield base64.b64decode(m.group(1).encode("ascii"))
 
 
 def _normalize_lang(lang: Optional[str], channel_code: Optional[str]) -> str:
@@ -77,34 +140,74 @@ def _chunk_by_limit(sentences: List[str], max_chars: int = 3000) -> List[str]:
     return chunks
 
 
-def _speak_chunk(text: str, lang: str, retries: int = 3, backoff: float = 2.0) -> AudioSegment:
+def _chunk_cache_path(text: str, lang: str) -> str:
+    key = hashlib.sha1(f"{lang}\0{text}".encode("utf-8")).hexdigest()
+    return os.path.join(TTS_CACHE_DIR, f"{key}.mp3")
+
+
+def _speak_chunk(text: str, lang: str, retries: int = 3, backoff: float = 2.0) -> bytes:
     """
-    Synthesize one chunk with retries; return as pydub AudioSegment.
+    Synthesize one chunk with retries; return the raw MP3 bytes.
+    Served from the on-disk cache when this (lang, text) was synthesized before.
     """
+    cached = _chunk_cache_path(text, lang)
+    if os.path.exists(cached):
+        with open(cached, "rb") as f:
+            return f.read()
+
+    os.makedirs(TTS_CACHE_DIR, exist_ok=True)
     for attempt in range(1, retries + 1):
         try:
-            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmp:
+            # write next to the cache entry, then rename: readers never see a partial MP3
+            with tempfile.NamedTemporaryFile(suffix=".mp3", dir=TTS_CACHE_DIR, delete=False) as tmp:
                 tmp_path = tmp.name
-            # gTTS: set only 'lang'; tld left default for simplicity.
-            gTTS(text=text, lang=lang).save(tmp_path)
-            seg = AudioSegment.from_mp3(tmp_path)
             try:
-                os.remove(tmp_path)
-            except Exception:
-                pass
-            return seg
+                # gTTS: set only 'lang'; tld left default for simplicity.
+                _PooledGTTS(text=text, lang=lang).save(tmp_path)
+                with open(tmp_path, "rb") as f:
+                    data = f.read()
+                if not data:
+                    raise RuntimeError("gTTS returned no audio")
+                os.replace(tmp_path, cached)
+            finally:
+                try:
+                    os.remove(tmp_path)
+                except Exception:
+                    pass
+            return data
         except Exception as e:
             if attempt == retries:
                 raise
             time.sleep(backoff * attempt)  # exponential-ish backoff
 
 
+def _join_segments(segs: Iterable["AudioSegment"]) -> "AudioSegment":
+    """
+    Concatenate segments in one pass into a single growing buffer.
+    pydub's `a + b` copies the whole accumulated buffer each time (O(N²) over chunks);
+    consuming `segs` lazily also means only one decoded chunk is alive besides the buffer.
+    """
+    buf = bytearray()
+    proto = None
+    for s in segs:
+        if proto is None:
+            proto = s._spawn(b"")  # metadata only; don't keep the first chunk's PCM alive
+        else:
+            s = s.set_frame_rate(proto.frame_rate).set_sample_width(proto.sample_width).set_channels(proto.channels)
+        buf += s.raw_data
+    if proto is None:
+        from pydub import AudioSegment
+        return AudioSegment.silent(duration=0)
+    return proto._spawn(buf)
+
+
 def text_to_speech(text: str, output_path: str, lang: Optional[str] = None, channel_code: Optional[str] = None):
     """
     Convert text → MP3 using gTTS with basic robustness:
       - auto language from lang or channel_code (EN/HI/BN)
-      - splits long scripts into safe chunks
-      - concatenates into one MP3
+      - splits long scripts into safe chunks (synthesized concurrently)
+      - concatenates into one MP3 (MP3 frames are appended as-is, no re-encode)
+    Other output extensions (.wav, .m4a, …) go through a pydub decode + export.
     """
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
@@ -113,12 +216,19 @@ def text_to_speech(text: str, output_path: str, lang: Optional[str] = None, chan
     sentences = _sentence_split(cleaned)
     chunks = _chunk_by_limit(sentences, max_chars=3000)
 
-    # Synthesize and concatenate
-    final = AudioSegment.silent(duration=0)
-    for idx, ch in enumerate(chunks, 1):
-        seg = _speak_chunk(ch, norm_lang)
-        final += seg
-
-    # Export single MP3
-    final.export(output_path, format="mp3")
+    # Synthesize chunks concurrently (gTTS is pure network wait); map() keeps order
+    parts = list(_TTS_POOL.map(lambda ch: _speak_chunk(ch, norm_lang), chunks))
+
+    fmt = os.path.splitext(output_path)[1].lstrip(".").lower() or "mp3"
+    needs_pydub = fmt != "mp3"
+    if not needs_pydub:
+        # MP3 frames decode independently, so back-to-back chunks play as one stream
+        # (gTTS itself builds each chunk this way from its 100-char requests)
+        with open(output_path, "wb") as f:
+            for b in parts:
+                f.write(b)
+    else:
+        from pydub import AudioSegment
+        segs = (AudioSegment.from_file(io.BytesIO(b), format="mp3") for b in parts)
+        _join_segments(segs).export(output_path, format=fmt)
     print(f"🎤 Audio saved ({norm_lang}): {output_path}")
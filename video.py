@@ -2,27 +2,66 @@
 # - Derives queries from channel + keywords (Hindi/Bengali supported via tiny maps)
 # - Tries multiple queries (broad → specific), vertical-first, size=large
 # - Downloads the chosen clips (stable on CI) with small retry/cache
-# - Falls back to a dark moving solid if zero results
+# - Falls back to a dark solid if zero results
+# - Optional burned-in captions (BURN_IN_CAPTIONS=1), in the same encode pass
+# - Renders with a single ffmpeg filtergraph (scale/crop/trim/zoompan/concat + audio mux);
+#   frames never pass through Python
 # - Uses CRF + x264 preset (env-tunable) and prints progress before encode
 
-import os, re, time, hashlib, requests, io
-from typing import List, Optional, Dict
-from moviepy.editor import (
-    VideoFileClip, AudioFileClip, concatenate_videoclips,
-    CompositeVideoClip, vfx, ColorClip
-)
+import os, re, time, hashlib, requests, io, json, inspect, functools, tempfile, shutil, subprocess, heapq, threading, textwrap
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Collection, List, Optional, Dict, Tuple
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import imageio_ffmpeg
 
-MEDIA_DIR = "input/media_temp"
+# downloaded / pre-scaled Pexels clips; under cache/ so CI's actions/cache keeps them between runs
+CLIP_CACHE_DIR = os.getenv("CLIP_CACHE_DIR", os.path.join("cache", "clips"))
 OUT_DIR   = "output/final"
-os.makedirs(MEDIA_DIR, exist_ok=True)
+os.makedirs(CLIP_CACHE_DIR, exist_ok=True)
 os.makedirs(OUT_DIR,   exist_ok=True)
 
-TARGET_W, TARGET_H, FPS = 1080, 1920, 30
-BITRATE = "8000k"  # kept for reference; not used when CRF is active
+TARGET_W, TARGET_H = 1080, 1920
+OUT_FPS = 24  # a bit lighter than 30
+BG_COLOR = "0x0c0c10"  # fallback background when no clips are available
+BITRATE = "8000k"  # only for the hardware encoders; libx264 runs in CRF mode
 
 # --- speed/quality knobs (overridable via env) ---
-ENC_PRESET = os.getenv("X264_PRESET", "veryfast")   # ultrafast…placebo
+ENC_PRESET = os.getenv("X264_PRESET", "")           # ultrafast…placebo; empty = pick by CPU count
 ENC_CRF    = os.getenv("X264_CRF", "23")            # lower = higher quality
+ENC_TUNE   = os.getenv("X264_TUNE", "fastdecode")   # no CABAC/deblock: cheaper to encode and play; empty = none
+SEG_ZOOM   = float(os.getenv("SEGMENT_ZOOM", "0.02"))  # per-segment center zoom; 0 = off (skips zoompan)
+
+# captions: one subtitle per paragraph, burned in during the main encode (needs libass)
+BURN_IN_CAPTIONS = os.getenv("BURN_IN_CAPTIONS", "0") == "1"
+CAPTION_STYLE = (
+    "FontName=DejaVu Sans,FontSize=9,PrimaryColour=&H00FFFFFF,OutlineColour=&H00000000,"
+    "BorderStyle=1,Outline=2,Shadow=0,Alignment=2,MarginV=40"
+)
+
+# concurrent ffmpeg encodes per process; the cores are split evenly between them
+_CPUS = os.cpu_count() or 1
+ENCODE_JOBS = max(1, int(os.getenv("ENCODE_JOBS", str(max(1, _CPUS // 8)))))
+_ENCODE_SLOTS = threading.BoundedSemaphore(ENCODE_JOBS)
+
+def _pick_x264_params(cpu: int = _CPUS, height: int = TARGET_H) -> Dict[str, object]:
+    """
+    Preset/thread pair for one x264 encode given the cores it gets.
+    Few cores -> a fast preset to keep renders short; plenty -> spend them on quality.
+    Smaller frames are cheaper, so they move one step slower on the same hardware.
+    """
+    ladder = ["veryfast", "faster", "fast", "medium"]
+    step = 0 if cpu <= 4 else 1 if cpu <= 8 else 3
+    if height <= 1280:
+        step = min(step + 1, len(ladder) - 1)
+    return {"preset": ENC_PRESET or ladder[step], "threads": max(1, cpu)}
+
+X264 = _pick_x264_params(max(1, _CPUS // ENCODE_JOBS))
+
+# honours IMAGEIO_FFMPEG_EXE (CI points it at the system ffmpeg), else the bundled binary
+FFMPEG = imageio_ffmpeg.get_ffmpeg_exe()
+FFPROBE = os.getenv("FFPROBE", "ffprobe")
 
 # ---------------- Keywords & maps ----------------
 
@@ -31,6 +70,8 @@ the and with your that this then have will just like very from into you for are
 """.split())
 STOP_HI = set("है और या या/या कि यह वह तुम आप हम मैं हैं के को से एक भी तो पर में फिर अगर क्योंकि लेकिन तथा होकर जब तक तब बाद पहले बिना जैसे कुछ कोई करना करना है की के लिए नहीं".split())
 STOP_BN = set("এবং বা যে এই ওই তুমি আপনি আমরা আমি হয় হয়েছে থেকে একটি কিন্তু তাই পরে আগে যদি যখন তবে এবং করেন করা করি করি না হবে".split())
+# stopwords per script language (HI/BN scripts mix in English words)
+STOP_BY_LANG = {"hi": frozenset(STOP_HI | STOP_EN), "bn": frozenset(STOP_BN | STOP_EN)}
 
 # rough topic → query helpers for HI/BN tokens
 TOPIC_MAP = {
@@ -69,35 +110,20 @@ GENERIC_FALLBACKS = [
 
 # ---------------- Utilities ----------------
 
-def _verticalize(clip: VideoFileClip) -> VideoFileClip:
-    c = clip.resize(height=TARGET_H)
-    if c.w < TARGET_W:
-        c = clip.resize(width=TARGET_W)
-    x1 = max(0, (c.w - TARGET_W) / 2)
-    return c.crop(x1=x1, y1=0, x2=x1 + TARGET_W, y2=TARGET_H)
-
-def _safe_loop(clip: VideoFileClip, duration: float) -> VideoFileClip:
-    if duration <= 0.1: duration = 0.1
-    try:
-        return clip.fx(vfx.loop, duration=duration)
-    except Exception:
-        return clip.set_duration(duration)
-
 def _paragraphs(txt: str) -> List[str]:
     paras = [p.strip() for p in re.split(r"\n\s*\n", (txt or "").strip()) if p.strip()]
     return paras if paras else [txt.strip()]
 
+# unicode-aware words (letters only, no digits/underscore)
+_WORD_RE = re.compile(r"[^\W\d_]+", re.UNICODE)
+
 def _words(txt: str) -> List[str]:
-    # unicode-aware words (letters only, no digits/underscore)
-    return re.findall(r"[^\W\d_]+", txt.lower(), flags=re.UNICODE)
+    return _WORD_RE.findall(txt.lower())
 
-def _top_keywords(txt: str, stop: set, k: int = 6) -> List[str]:
-    freq = {}
-    for w in _words(txt):
-        if w in stop or len(w) < 3:
-            continue
-        freq[w] = freq.get(w, 0) + 1
-    return [w for w,_ in sorted(freq.items(), key=lambda x: (-x[1], -len(x[0])))][:k]
+def _top_keywords(words: List[str], stop: set, k: int = 6) -> List[str]:
+    freq = Counter(w for w in words if len(w) >= 3 and w not in stop)
+    # most frequent first, longer words win ties
+    return [w for w, _ in heapq.nsmallest(k, freq.items(), key=lambda x: (-x[1], -len(x[0])))]
 
 def _family_code(channel_code: Optional[str]) -> str:
     if not channel_code:
@@ -121,21 +147,18 @@ def _auto_queries(script_text: str, meta: Optional[Dict]) -> List[str]:
     if fam in FAMILY_DEFAULT:
         q.append(FAMILY_DEFAULT[fam])
 
+    # tokenize once; the topic lookup and keyword counting share the list
+    words = _words(script_text)
+
     # Try mapped Indic tokens to English phrases
-    for w in _words(script_text):
-        if w in TOPIC_MAP:
-            q.append(TOPIC_MAP[w])
+    q.extend(TOPIC_MAP[w] for w in words if w in TOPIC_MAP)
 
     # Language stopwords
     lang = (meta or {}).get("lang", "").lower()
-    stop = STOP_EN
-    if lang == "hi":
-        stop = STOP_HI | STOP_EN
-    elif lang == "bn":
-        stop = STOP_BN | STOP_EN
+    stop = STOP_BY_LANG.get(lang, STOP_EN)
 
     # Mix top keywords into family-themed searches
-    kws = _top_keywords(script_text, stop, k=6)
+    kws = _top_keywords(words, stop, k=6)
     if kws:
         anchors = {
             "HM": ["temple", "incense", "sunrise", "saffron"],
@@ -158,12 +181,73 @@ def _auto_queries(script_text: str, meta: Optional[Dict]) -> List[str]:
 
 # ---------------- Pexels fetchers ----------------
 
+# One keep-alive pool for the Pexels API and its CDN (search + clip downloads)
+_PEXELS = requests.Session()
+_PEXELS.headers.update({"User-Agent": "ZyraTV-Pipeline/1.0"})
+_PEXELS.mount("https://", HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=16,
+    max_retries=Retry(total=2, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504]),
+))
+
+# searches for the next few candidate queries run ahead while we inspect the current one
+_SEARCH_POOL = ThreadPoolExecutor(max_workers=3)
+
+# search results / picked URL lists, reused across runs until they go stale
+PEXELS_CACHE_DIR = os.getenv("PEXELS_CACHE_DIR", os.path.join("cache", "pexels"))
+PEXELS_CACHE_TTL = float(os.getenv("PEXELS_CACHE_TTL", str(7 * 24 * 3600)))  # seconds; 0 = always refetch
+
+def _json_cached(keep):
+    """
+    Cache a function's JSON-able result in memory and on disk under PEXELS_CACHE_DIR,
+    keyed on its (bound) arguments. Only results for which keep(result) is true are stored,
+    so failed searches are retried next time.
+    """
+    def deco(fn):
+        sig = inspect.signature(fn)
+        memo: Dict[str, object] = {}
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            raw = json.dumps([fn.__name__, list(bound.arguments.values())], ensure_ascii=False)
+            key = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+            if key in memo:
+                return memo[key]
+
+            path = os.path.join(PEXELS_CACHE_DIR, f"{key}.json")
+            try:
+                if time.time() - os.path.getmtime(path) < PEXELS_CACHE_TTL:
+                    with open(path, "r", encoding="utf-8") as f:
+                        memo[key] = json.load(f)
+                    return memo[key]
+            except (OSError, ValueError):
+                pass
+
+            result = fn(*args, **kwargs)
+            if keep(result):
+                memo[key] = result
+                try:
+                    os.makedirs(PEXELS_CACHE_DIR, exist_ok=True)
+                    with tempfile.NamedTemporaryFile(
+                        "w", encoding="utf-8", dir=PEXELS_CACHE_DIR, suffix=".tmp", delete=False
+                    ) as f:
+                        json.dump(result, f, ensure_ascii=False)
+                    os.replace(f.name, path)
+                except OSError:
+                    pass
+            return result
+        return wrapper
+    return deco
+
+@_json_cached(keep=lambda resp: resp["ok"])
 def _pexels_search(query: str, per_page: int = 12) -> dict:
     key = os.getenv("PEXELS_API_KEY", "").strip()
     if not key:
         return {"ok": False, "status": 0, "videos": []}
     try:
-        r = requests.get(
+        r = _PEXELS.get(
             "https://api.pexels.com/videos/search",
             params={
                 "query": query,
@@ -171,7 +255,7 @@ def _pexels_search(query: str, per_page: int = 12) -> dict:
                 "orientation": "portrait",   # vertical-first
                 "size": "large",
             },
-            headers={"Authorization": key, "User-Agent": "ZyraTV-Pipeline/1.0"},
+            headers={"Authorization": key},
             timeout=30,
         )
         data = r.json() if r.headers.get("content-type","").startswith("application/json") else {}
@@ -179,7 +263,8 @@ def _pexels_search(query: str, per_page: int = 12) -> dict:
     except Exception:
         return {"ok": False, "status": 0, "videos": []}
 
-def _pick_vertical_urls(videos: List[dict], need: int) -> List[str]:
+def _pick_vertical_urls(videos: List[dict], need: int, exclude: Collection[str] = ()) -> List[str]:
+    """Best vertical file of each video, up to `need`; videos whose pick is in `exclude` are skipped."""
     urls = []
     for v in videos:
         files = sorted(
@@ -192,30 +277,38 @@ def _pick_vertical_urls(videos: List[dict], need: int) -> List[str]:
             w, h = f.get("width", 0), f.get("height", 0)
             link = f.get("link", "")
             if link and h >= w and link.startswith("http"):
-                urls.append(link)
+                if link not in exclude:
+                    urls.append(link)
                 break
         if len(urls) >= need:
             break
     return urls
 
+@_json_cached(keep=lambda urls: bool(urls))
 def _pexels_pick_multi(queries: List[str], need: int = 3) -> List[str]:
     """
     Try a series of queries until we collect up to `need` vertical clips.
     Includes an automatic 'nature' / 'city' safety pass at the end.
     """
     collected: List[str] = []
-    tried = 0
-    for q in queries:
-        tried += 1
-        print(f"🔎 Pexels query[{tried}]={q!r}")
-        resp = _pexels_search(q, per_page=max(need*4, 12))
-        print(f"   status={resp['status']} videos={len(resp['videos'])}")
-        if not resp["ok"]:
-            continue
-        urls = _pick_vertical_urls(resp["videos"], need=need - len(collected))
-        collected.extend(urls)
-        if len(collected) >= need:
-            break
+    # fire searches concurrently, but consume them in priority order
+    futures = [_SEARCH_POOL.submit(_pexels_search, q, max(need*4, 12)) for q in queries]
+    try:
+        for tried, (q, fut) in enumerate(zip(queries, futures), start=1):
+            print(f"🔎 Pexels query[{tried}]={q!r}")
+            resp = fut.result()
+            print(f"   status={resp['status']} videos={len(resp['videos'])}")
+            if not resp["ok"]:
+                continue
+            # different queries often surface the same video; only new ones count towards `need`
+            urls = _pick_vertical_urls(resp["videos"], need=need - len(collected), exclude=collected)
+            collected.extend(urls)
+            if len(collected) >= need:
+                break
+    finally:
+        # don't spend API quota on queries we no longer need
+        for fut in futures:
+            fut.cancel()
 
     if len(collected) < need:
         for fallback in ["nature portrait", "city lights portrait"]:
@@ -223,7 +316,7 @@ def _pexels_pick_multi(queries: List[str], need: int = 3) -> List[str]:
             resp = _pexels_search(fallback, per_page=max(need*3, 9))
             print(f"   status={resp['status']} videos={len(resp['videos'])}")
             if resp["ok"]:
-                urls = _pick_vertical_urls(resp["videos"], need=need - len(collected))
+                urls = _pick_vertical_urls(resp["videos"], need=need - len(collected), exclude=collected)
                 collected.extend(urls)
                 if len(collected) >= need:
                     break
@@ -232,109 +325,472 @@ def _pexels_pick_multi(queries: List[str], need: int = 3) -> List[str]:
 
 # ---------------- Download (cache) ----------------
 
+# shared across scripts; clip downloads are pure network wait
+DOWNLOAD_WORKERS = max(1, int(os.getenv("DOWNLOAD_WORKERS", "8")))
+_DL_POOL = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS)
+
+# the CI cache is re-saved after every run, so the clip cache is bounded: clips unused for
+# CLIP_CACHE_TTL expire, then the least recently used go until it fits CLIP_CACHE_MAX_MB
+CLIP_CACHE_TTL = float(os.getenv("CLIP_CACHE_TTL", str(7 * 24 * 3600)))  # seconds since last use
+CLIP_CACHE_MAX_MB = float(os.getenv("CLIP_CACHE_MAX_MB", "2048"))
+
+def _touch(path: str) -> None:
+    # mtime doubles as "last used" for pruning (atime is unreliable on noatime/relatime mounts)
+    try: os.utime(path)
+    except OSError: pass
+
+def prune_clip_cache() -> None:
+    """
+    Bound the clip cache; call once before any render starts. Drops temp files left by
+    killed runs, raw downloads superseded by a vertical copy, clips unused for
+    CLIP_CACHE_TTL, then the least recently used clips until under CLIP_CACHE_MAX_MB.
+    """
+    now = time.time()
+    with os.scandir(CLIP_CACHE_DIR) as it:
+        entries = [e for e in it if e.is_file(follow_symlinks=False)]
+    names = {e.name for e in entries}
+
+    kept, removed = [], 0
+    for e in entries:
+        st = e.stat()
+        if e.name.endswith((".part", ".part.mp4")):
+            drop = True
+        elif e.name.startswith("px_") and e.name.endswith(".mp4"):
+            superseded = not e.name.endswith("_v.mp4") and e.name[:-4] + "_v.mp4" in names
+            drop = superseded or now - st.st_mtime > CLIP_CACHE_TTL
+        else:
+            continue
+        if drop:
+            try:
+                os.remove(e.path); removed += 1
+            except OSError:
+                pass
+        else:
+            kept.append((st.st_mtime, st.st_size, e.path))
+
+    total = sum(size for _, size, _ in kept)
+    cap = CLIP_CACHE_MAX_MB * 1024 * 1024
+    for _, size, path in sorted(kept):  # oldest first
+        if total <= cap:
+            break
+        try:
+            os.remove(path); removed += 1; total -= size
+        except OSError:
+            pass
+    if removed:
+        print(f"🧹 clip cache: removed {removed} file(s), {total / 1048576:.0f} MB kept")
+
 def _url_cache_path(url: str) -> str:
     h = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
-    return os.path.join(MEDIA_DIR, f"px_{h}.mp4")
-
-def _download(url: str, dest: str, retries: int = 2) -> bool:
+    return os.path.join(CLIP_CACHE_DIR, f"px_{h}.mp4")
+
+def _vertical_cache_path(url: str) -> str:
+    # same key as the raw download; once this exists, prune_clip_cache drops the raw file
+    return _url_cache_path(url)[:-len(".mp4")] + "_v.mp4"
+
+def _local_clip(url: str) -> Optional[str]:
+    """Best cached copy of `url` (pre-verticalized first), or None if nothing is cached."""
+    for path in (_vertical_cache_path(url), _url_cache_path(url)):
+        if os.path.exists(path):
+            _touch(path)
+            return path
+    return None
+
+def _download(url: str, retries: int = 2) -> Optional[str]:
+    """Fetch `url` into the clip cache (no-op if already there); local path or None."""
+    dest = _url_cache_path(url)
+    if os.path.exists(dest):
+        _touch(dest)
+        return dest
+    print(f"⬇️  downloading clip → {dest}")
     for attempt in range(retries + 1):
+        tmp = None
         try:
-            with requests.get(url, stream=True, timeout=30) as r:
+            # into a private temp file, renamed on success: an interrupted download never
+            # leaves a truncated clip behind for the next run to pick up
+            with _PEXELS.get(url, stream=True, timeout=30) as r:
                 r.raise_for_status()
-                with open(dest, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=1024*1024):
-                        if chunk:
-                            f.write(chunk)
-            return True
+                r.raw.decode_content = True
+                with tempfile.NamedTemporaryFile(dir=CLIP_CACHE_DIR, suffix=".part", delete=False) as f:
+                    tmp = f.name
+                    shutil.copyfileobj(r.raw, f, length=1 << 20)
+            os.replace(tmp, dest)
+            return dest
         except Exception as e:
+            if tmp:
+                try: os.remove(tmp)
+                except Exception: pass
             if attempt == retries:
                 print(f"   download failed: {e}")
-                return False
+                return None
             time.sleep(1.0 + attempt)
 
-# ---------------- Main ----------------
-
-def make_video(audio_path: str, script_text: str, meta: Optional[Dict] = None) -> str:
-    if not os.path.exists(audio_path):
-        raise FileNotFoundError(f"Audio not found: {audio_path}")
+def _verticalize(src: str, dest: str) -> bool:
+    """
+    Transcode a downloaded clip to the render's frame (1080×1920, OUT_FPS, no audio),
+    so every later render of it skips the scale + crop.
+    """
+    with tempfile.NamedTemporaryFile(dir=CLIP_CACHE_DIR, suffix=".part.mp4", delete=False) as f:
+        tmp = f.name
+    cmd = [
+        FFMPEG, "-y", "-hide_banner", "-v", "error", "-i", src,
+        "-vf", f"scale={TARGET_W}:{TARGET_H}:force_original_aspect_ratio=increase,"
+               f"crop={TARGET_W}:{TARGET_H},setsar=1,fps={OUT_FPS}",
+        # fastdecode: every render decodes this file again, so keep it cheap to read
+        "-c:v", "libx264", "-preset", "veryfast", "-tune", "fastdecode", "-crf", "18",
+        "-pix_fmt", "yuv420p", "-an", tmp,
+    ]
+    try:
+        with _ENCODE_SLOTS:
+            subprocess.run(cmd, check=True)
+        os.replace(tmp, dest)
+        return True
+    except Exception as e:
+        print(f"   verticalize failed for {src}: {getattr(e, 'returncode', e)}")
+        try: os.remove(tmp)
+        except Exception: pass
+        return False
+
+# one lock per clip URL: scripts rendering concurrently often pick the same clip, and
+# the second one should wait for the first download/transcode rather than redo it
+# (or delete the raw file from under it)
+_CLIP_LOCKS: Dict[str, threading.Lock] = {}
+_CLIP_LOCKS_GUARD = threading.Lock()
+
+def _clip_lock(url: str) -> threading.Lock:
+    with _CLIP_LOCKS_GUARD:
+        return _CLIP_LOCKS.setdefault(url, threading.Lock())
+
+def _cached_clip(url: str) -> Optional[str]:
+    """
+    Local copy of `url`, None on failure. The first use only downloads it: the render
+    scales the raw file itself, which is cheaper than transcoding the whole clip up front.
+    A clip that comes back (cached raw download) is verticalized once. The raw file stays
+    until the next run's prune: a concurrent render may already have been handed its path.
+    """
+    vert = _vertical_cache_path(url)
+    if os.path.exists(vert):
+        _touch(vert)
+        return vert
+    with _clip_lock(url):
+        if os.path.exists(vert):
+            return vert
+        dest = _url_cache_path(url)
+        if not os.path.exists(dest):
+            return _download(url)
+        if not _verticalize(dest, vert):
+            # undecodable download: drop it so the next run fetches it again
+            try: os.remove(dest)
+            except Exception: pass
+            return None
+        return vert
 
-    narration = AudioFileClip(audio_path)
-    total_dur = max(0.1, narration.duration)
+def _cache_clips(urls: List[str]) -> List[Optional[str]]:
+    """Download missing clips concurrently; local paths in `urls` order (None = failed)."""
+    return list(_DL_POOL.map(_cached_clip, urls))
 
+def _pick_urls(script_text: str, meta: Optional[Dict]) -> List[str]:
     # Build multi-query list and collect candidate URLs
     queries = _auto_queries(script_text, meta)
     need = int(os.getenv("SEGMENTS", "3"))
-    urls  = _pexels_pick_multi(queries, need=max(1, need))
+    return _pexels_pick_multi(queries, need=max(1, need))
 
-    # Prepare background clips (download for stability)
-    vclips: List[VideoFileClip] = []
-    for url in urls:
-        dest = _url_cache_path(url)
-        if not os.path.exists(dest):
-            print(f"⬇️  downloading clip → {dest}")
-            ok = _download(url, dest)
-            if not ok:
-                continue
-        try:
-            c = VideoFileClip(dest)
-            vclips.append(_verticalize(c))
-        except Exception as e:
-            print("   open failed:", e)
+def prefetch_clips(script_text: str, meta: Optional[Dict] = None) -> List[str]:
+    """
+    Pick Pexels clips for a script and warm the download cache.
+    Meant to run in the background while TTS is synthesizing;
+    pass the result to make_video(prefetched_urls=...).
+    """
+    urls = _pick_urls(script_text, meta)
+    _cache_clips(urls)
+    return urls
 
-    # No clips? Use a dark moving solid
-    if not vclips:
-        base = ColorClip(size=(TARGET_W, TARGET_H), color=(12, 12, 16)).set_fps(FPS)
-        vclips = [base]
+# ---------------- Render (ffmpeg) ----------------
 
-    # Allocate durations by paragraph weight
-    paras = _paragraphs(script_text)
-    count = min(len(vclips), max(1, len(paras)))
-    weights = [len(p) for p in paras[:count]]
-    wsum = sum(weights) or 1.0
-    seg_durs = [total_dur * (w/wsum) for w in weights]
-
-    segs = []
-    for i in range(count):
-        base = vclips[min(i, len(vclips) - 1)]
-        seg  = _safe_loop(base, seg_durs[i]).set_fps(FPS)
-        # subtle zoom to avoid static feel
+_DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+_AUDIO_CODEC_RE = re.compile(r"Stream #\S+.*?: Audio: (\w+)")
+
+def _probe_audio(path: str) -> Tuple[float, Optional[str]]:
+    """
+    (duration in seconds, codec of the first audio stream), read from metadata (nothing is decoded).
+    Uses ffprobe when it's on PATH; the bundled imageio build ships only ffmpeg,
+    so otherwise the header `ffmpeg -i` prints is parsed instead.
+    """
+    try:
+        out = subprocess.run(
+            [FFPROBE, "-v", "quiet", "-print_format", "json",
+             "-show_format", "-show_streams", "-select_streams", "a:0", path],
+            capture_output=True, check=True,
+        ).stdout
+        info = json.loads(out)
+        streams = info.get("streams") or [{}]
+        return float(info["format"]["duration"]), streams[0].get("codec_name")
+    except (OSError, subprocess.CalledProcessError, KeyError, ValueError):
+        pass
+    # `ffmpeg -i` with no output always exits non-zero; the header is all we need
+    err = subprocess.run([FFMPEG, "-hide_banner", "-i", path], capture_output=True).stderr
+    header = err.decode("utf-8", "replace")
+    m = _DURATION_RE.search(header)
+    if not m:
+        raise RuntimeError(f"Could not read duration of {path}")
+    h, mnt, sec = m.groups()
+    codec = _AUDIO_CODEC_RE.search(header)
+    return int(h) * 3600 + int(mnt) * 60 + float(sec), codec.group(1) if codec else None
+
+# GPU H.264 encoders, in order of preference. "pre" goes before the inputs,
+# "filter" is appended to the video graph, "args" are the encoder options.
+# libx264 (X264_PRESET / X264_CRF) is the fallback when none of these works, and the only
+# encoder unless ALLOW_HWENC=1 (CI stays on libx264 so its output is reproducible).
+ALLOW_HWENC = os.getenv("ALLOW_HWENC", "0") == "1"
+_HW_ENCODERS = {
+    "h264_nvenc": {
+        "args": ["-preset", "p5", "-rc", "vbr", "-b:v", BITRATE, "-maxrate", "10M", "-pix_fmt", "yuv420p"],
+    },
+    "h264_vaapi": {
+        "pre": ["-vaapi_device", "/dev/dri/renderD128"],
+        "filter": "format=nv12,hwupload",
+        "args": ["-qp", "24"],
+    },
+    "h264_videotoolbox": {"args": ["-b:v", BITRATE, "-pix_fmt", "yuv420p"]},
+}
+
+@functools.lru_cache(maxsize=None)
+def _h264_encoder() -> str:
+    """
+    Best working H.264 encoder, probed once per process.
+    Being listed by `ffmpeg -encoders` isn't enough (distro builds list nvenc/vaapi
+    without a GPU present), so each candidate must survive a tiny test encode.
+    """
+    if not ALLOW_HWENC:
+        return "libx264"
+    try:
+        listed = subprocess.run(
+            [FFMPEG, "-hide_banner", "-encoders"], capture_output=True, text=True, timeout=20
+        ).stdout
+    except Exception:
+        return "libx264"
+    for name, opts in _HW_ENCODERS.items():
+        if name not in listed:
+            continue
+        probe = [FFMPEG, "-v", "error", *opts.get("pre", []),
+                 "-f", "lavfi", "-i", "color=s=256x256:d=0.1"]
+        if "filter" in opts:
+            probe += ["-vf", opts["filter"]]
+        probe += ["-c:v", name, *opts["args"], "-f", "null", "-"]
         try:
-            seg = seg.fx(vfx.resize, lambda t: 1.0 + 0.02 * (t / max(seg_durs[i], 0.1)))
+            if subprocess.run(probe, capture_output=True, timeout=30).returncode == 0:
+                return name
         except Exception:
             pass
-        segs.append(seg)
+    return "libx264"
 
-    video = concatenate_videoclips(segs, method="compose") if len(segs) > 1 else segs[0]
-    video = video.set_audio(narration)
+def _segment_filter(idx: int, dur: float, zoom: bool = True) -> str:
+    """
+    Fill the vertical frame with input `idx` (scale + center crop), cut it to `dur` seconds
+    and add a subtle center zoom (1.00 → 1+SEG_ZOOM over the segment) to avoid a static feel.
+    """
+    chain = (
+        f"[{idx}:v]scale={TARGET_W}:{TARGET_H}:force_original_aspect_ratio=increase,"
+        f"crop={TARGET_W}:{TARGET_H},setsar=1,fps={OUT_FPS},"
+        f"trim=duration={dur:.3f},setpts=PTS-STARTPTS"
+    )
+    if zoom and SEG_ZOOM > 0:
+        # a full-frame resample per output frame: the costliest filter in the graph
+        frames = max(1, round(dur * OUT_FPS))
+        chain += (
+            f",zoompan=z='1+{SEG_ZOOM:g}*on/{frames}':x='iw/2-iw/zoom/2':y='ih/2-ih/zoom/2'"
+            f":d=1:s={TARGET_W}x{TARGET_H}:fps={OUT_FPS}"
+        )
+    return chain + f"[v{idx}]"
+
+# one wrapper for every caption; ~36 chars keeps two short lines inside the vertical frame
+_WRAPPER = textwrap.TextWrapper(width=36, break_long_words=False)
+
+def _write_srt(paras: List[str], durs: List[float], path: str) -> str:
+    def ts(sec: float) -> str:
+        # whole milliseconds once, then integer divmods only
+        h, rem = divmod(int(sec * 1000), 3_600_000)
+        m, rem = divmod(rem, 60_000)
+        s, ms = divmod(rem, 1000)
+        return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+
+    parts = []
+    start = 0.0
+    for i, (p, d) in enumerate(zip(paras, durs), start=1):
+        end = start + d
+        parts.append(f"{i}\n{ts(start)} --> {ts(end)}\n" + "\n".join(_WRAPPER.wrap(p) or [p]) + "\n\n")
+        start = end
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("".join(parts))
+    return path
+
+def _subtitles_filter(srt_path: str) -> str:
+    # quoted filtergraph values; ':' still needs escaping for the filter's own option parser
+    name = srt_path.replace("\\", "/").replace(":", "\\:")
+    return f"subtitles=filename='{name}':force_style='{CAPTION_STYLE}'"
+
+def _audio_codec_args(codec: Optional[str]) -> List[str]:
+    # MP4 carries MP3 and AAC as-is: mux the TTS track without a second lossy encode
+    if codec in ("aac", "mp3"):
+        return ["-c:a", "copy"]
+    return ["-c:a", "aac", "-b:a", "128k"]
+
+# seconds an ffmpeg network read/write may stall on a streamed clip (same as the download timeout)
+STREAM_TIMEOUT_S = 30
+
+def _render(
+    sources: List[str],
+    seg_durs: List[float],
+    audio_path: str,
+    total_dur: float,
+    out_path: str,
+    srt_path: Optional[str] = None,
+    audio_codec: Optional[str] = None,
+):
+    """
+    One ffmpeg run: each source (local file or URL) is looped (-stream_loop), read only for
+    its segment's length (-t) and cut to it, the segments are concatenated, captions (if any)
+    are burned in, and the result is muxed with the narration. No sources → a solid color background.
+    """
+    encoder = _h264_encoder()
+    hw = _HW_ENCODERS.get(encoder, {})
+
+    cmd = [FFMPEG, "-y", "-hide_banner", "-v", "warning", "-stats", *hw.get("pre", [])]
+    if sources:
+        for src, dur in zip(sources, seg_durs):
+            if src.startswith(("http://", "https://")):
+                # a stalled CDN read fails the attempt instead of hanging with an encode slot held
+                cmd += ["-rw_timeout", str(STREAM_TIMEOUT_S * 1_000_000)]
+            # stop demuxing each looped input just past its segment instead of at trim's EOF
+            cmd += ["-stream_loop", "-1", "-t", f"{dur + 0.5:.3f}", "-i", src]
+    else:
+        # generated at the output size and rate, and only for as long as the narration
+        cmd += ["-f", "lavfi", "-i",
+                f"color=c={BG_COLOR}:s={TARGET_W}x{TARGET_H}:r={OUT_FPS}:d={total_dur:.3f}"]
+    audio_idx = max(1, len(sources))
+    cmd += ["-i", audio_path]
+
+    count = len(seg_durs)
+    # zooming into a flat color changes nothing on screen, so the solid background skips it
+    graph = [_segment_filter(i, d, zoom=bool(sources)) for i, d in enumerate(seg_durs)]
+    tail = ""
+    if srt_path:
+        tail += "," + _subtitles_filter(srt_path)
+    if "filter" in hw:
+        tail += "," + hw["filter"]
+    graph.append("".join(f"[v{i}]" for i in range(count)) + f"concat=n={count}:v=1:a=0{tail}[vout]")
+    graph_txt = ";".join(graph)
+
+    # very long graphs (many segments) go through a file instead of the command line
+    graph_file = None
+    if len(graph_txt) > 4000:
+        with tempfile.NamedTemporaryFile("w", suffix=".ffgraph", encoding="utf-8", delete=False) as f:
+            f.write(graph_txt)
+        graph_file = f.name
+        cmd += ["-filter_complex_script", graph_file]
+    else:
+        cmd += ["-filter_complex", graph_txt]
+
+    if hw:
+        vcodec = ["-c:v", encoder, *hw["args"]]
+    else:
+        # frame threads (x264's default), never sliced threads: better quality per core
+        vcodec = ["-c:v", "libx264", "-preset", X264["preset"], "-crf", ENC_CRF,
+                  *(["-tune", ENC_TUNE] if ENC_TUNE else []),
+                  "-profile:v", "high", "-level", "4.0",
+                  "-pix_fmt", "yuv420p", "-threads", str(X264["threads"]),
+                  "-x264-params", "sliced-threads=0"]
+
+    cmd += [
+        "-map", "[vout]", "-map", f"{audio_idx}:a",
+        *vcodec,
+        *_audio_codec_args(audio_codec),
+        "-movflags", "+faststart",
+        "-t", f"{total_dur:.3f}",
+    ]
+    # encode next to the target, renamed on success: a failed or killed render never
+    # leaves a truncated <id>.mp4 that already_done() would then skip forever
+    # (".part" suffix, so the workflow's *.mp4 upload ignores leftovers)
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(out_path) or ".", suffix=".mp4.part", delete=False
+    ) as f:
+        tmp_out = f.name
+    cmd += ["-f", "mp4", tmp_out]
+    try:
+        with _ENCODE_SLOTS:
+            subprocess.run(cmd, check=True)
+        os.replace(tmp_out, out_path)
+    finally:
+        if graph_file:
+            os.remove(graph_file)
+        if os.path.exists(tmp_out):
+            os.remove(tmp_out)
+
+def _source_attempts(urls: List[str]):
+    """
+    Clip sources to try, in order:
+      1) cached files, with cold clips streamed by ffmpeg straight from the CDN
+         (fetch + decode in one pass, no download-then-reopen)
+      2) everything re-resolved through the cache (downloads what was streamed, picks up
+         copies verticalized meanwhile); skipped if that's exactly what already failed
+      3) no clips at all (solid background), so a bad clip never costs the video
+    """
+    sources = [_local_clip(u) or u for u in urls]
+    yield sources
+    cached = [p for p in _cache_clips(urls) if p]
+    if cached != sources:
+        yield cached
+    yield []
+
+# ---------------- Main ----------------
+
+def make_video(
+    audio_path: str,
+    script_text: str,
+    meta: Optional[Dict] = None,
+    prefetched_urls: Optional[List[str]] = None,
+) -> str:
+    if not os.path.exists(audio_path):
+        raise FileNotFoundError(f"Audio not found: {audio_path}")
+
+    total_dur, audio_codec = _probe_audio(audio_path)
+    total_dur = max(0.1, total_dur)
+
+    urls = prefetched_urls if prefetched_urls is not None else _pick_urls(script_text, meta)
+    # one ffmpeg input (one decoder) per distinct clip; different queries can return the same file
+    urls = list(dict.fromkeys(urls))
+    paras = _paragraphs(script_text)
+    lens = [len(p) for p in paras]
 
     script_id = (meta or {}).get("id") or os.path.splitext(os.path.basename(audio_path))[0]
     out_path  = os.path.join(OUT_DIR, f"{script_id}.mp4")
 
-    # --- progress + tuned encode ---
-    print(f"🎛️  segments={len(segs)} total_dur={total_dur:.1f}s seg_durs={[round(d,1) for d in seg_durs]}")
-    print("⏳ Encoding to MP4… (libx264)")
-
-    video.write_videofile(
-        out_path,
-        fps=24,  # a bit lighter than 30
-        codec="libx264",
-        audio_codec="aac",
-        preset=ENC_PRESET,
-        ffmpeg_params=["-crf", ENC_CRF, "-movflags", "+faststart", "-v", "verbose"],
-        threads=4,
-        temp_audiofile=os.path.join("output", "temp_audio.m4a"),
-        remove_temp=True,
-        verbose=True,
-        logger=None,
-    )
+    srt_path = None
+    if BURN_IN_CAPTIONS:
+        # every paragraph gets screen time proportional to its length
+        scale = total_dur / (sum(lens) or 1.0)
+        srt_path = _write_srt(
+            paras,
+            [n * scale for n in lens],
+            os.path.splitext(audio_path)[0] + ".srt",
+        )
 
-    # Cleanup
-    try:
-        video.close(); narration.close()
-        for c in vclips:
-            try: c.close()
-            except Exception: pass
-    except Exception:
-        pass
+    for sources in _source_attempts(urls):
+        # Allocate durations by paragraph weight (one segment per clip, at most one per paragraph)
+        count = min(max(1, len(sources)), max(1, len(paras)))
+        weights = lens[:count]
+        scale = total_dur / (sum(weights) or 1.0)
+        seg_durs = [max(0.1, w * scale) for w in weights]
+
+        # --- progress + tuned encode ---
+        print(f"🎛️  segments={len(seg_durs)} total_dur={total_dur:.1f}s seg_durs={[round(d,1) for d in seg_durs]}")
+        print(f"⏳ Encoding to MP4… (ffmpeg/{_h264_encoder()})")
+        try:
+            _render(sources[:count], seg_durs, audio_path, total_dur, out_path, srt_path, audio_codec)
+            return out_path
+        except subprocess.CalledProcessError as e:
+            if not sources:
+                raise
+            print(f"   render failed (ffmpeg exit {e.returncode}); retrying")
 
     return out_path